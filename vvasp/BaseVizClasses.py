@@ -1,11 +1,29 @@
 from .utils import *
 import pyvista as pv 
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 
 ACTIVE_COLOR = '#FF0000'
 INACTIVE_COLOR = '#000000'
 SPHERE_RADIUS = 50
-INIT_VEC = np.array([0, 10_000,0]) # just has to be long enough to intersect the brain surface
+ENTRY_POINT_SPHERE = pv.Sphere(radius=SPHERE_RADIUS) # tessellated once around (0,0,0), each probe copies and translates it
+INIT_VEC = np.array([0, 10_000,0], dtype=np.float32) # just has to be long enough to intersect the brain surface
+
+# (kind, unit shift) for the simple keyboard directions, the shift is scaled by the multiplier in move()
+DIRECTION_TABLE = {'left': ('move', np.array([-1,0,0])),
+                   'right': ('move', np.array([1,0,0])),
+                   'dorsal': ('move', np.array([0,0,1])),
+                   'ventral': ('move', np.array([0,0,-1])),
+                   'anterior': ('move', np.array([0,1,0])),
+                   'posterior': ('move', np.array([0,-1,0])),
+                   'tilt up': ('rotate', np.array([1,0,0])),
+                   'tilt down': ('rotate', np.array([-1,0,0])),
+                   'rotate left': ('rotate', np.array([0,0,1])),
+                   'rotate right': ('rotate', np.array([0,0,-1])),
+                   'spin left': ('rotate', np.array([0,1,0])),
+                   'spin right': ('rotate', np.array([0,-1,0])),}
+for _kind, _unit_vector in DIRECTION_TABLE.values():
+    _unit_vector.flags.writeable = False # shared between all objects, never modify in place
 
 class VVASPBaseVisualizerClass(ABC):
     """
@@ -14,6 +32,9 @@ class VVASPBaseVisualizerClass(ABC):
 
     Max Melin, 2024
     """
+    update_suspended = 0 # depth of nested batched_update() blocks, a class default so child classes can batch before calling super().__init__()
+    update_pending = False
+
     def __init__(self,
                  vistaplotter,
                  starting_position=(0,0,0),
@@ -27,15 +48,17 @@ class VVASPBaseVisualizerClass(ABC):
         self.active = active
         #angles[2] = -angles[2] # rotation about z is inverted for probes
         #angles[0] = -angles[0] # rotation about x is inverted for probes
-        self.origin = np.array([0,0,0]) # we will move to starting_position later by calling set_location()
-        self.angles = np.array([0,0,0])
+        self.origin = np.zeros(3, dtype=np.float32) # we will move to starting_position later by calling set_location()
+        self.angles = np.zeros(3, dtype=np.float32) # float32 like the vtk points, so moving the meshes never upcasts to float64
         self.rotation_matrix = rotation_matrix_from_degrees(*self.angles)
         self.meshes = []
         self.actors = []
         
         self.create_meshes()
-        self.spawn_actors()
-        self.set_location(np.array(starting_position),np.array(starting_angles))
+        self.pack_mesh_points()
+        with self.batched_update():
+            self.spawn_actors()
+            self.set_location(np.array(starting_position),np.array(starting_angles))
         
     
     @property
@@ -53,58 +76,72 @@ class VVASPBaseVisualizerClass(ABC):
         mesh2 = pv.PolyData()  # Replace this with your actual mesh creation
         self.meshes = [mesh1, mesh2]
 
+    def pack_mesh_points(self):
+        # keep the points of all meshes in one contiguous (n_points, 3) array and give each mesh a view into it,
+        # this way moving or rotating the object is a single numpy operation instead of one per mesh
+        self.meshes = tuple(self.meshes) # the set of meshes is fixed from here on
+        if not len(self.meshes):
+            self.mesh_points = np.empty((0,3), dtype=np.float32)
+            self.vtk_points = ()
+            return
+        self.mesh_points = np.concatenate([mesh.points for mesh in self.meshes]).astype(np.float32, copy=False)
+        start = 0
+        for mesh in self.meshes:
+            stop = start + mesh.n_points
+            mesh.points = self.mesh_points[start:stop]
+            start = stop
+        self.vtk_points = tuple(mesh.GetPoints() for mesh in self.meshes) # the vtkPoints wrapping the views, see mark_points_modified()
+
     def spawn_actors(self):
         #add the actors to the plotter
-        for mesh in self.meshes:
-            self.actors.append(self.plotter.add_mesh(mesh, **self.pyvista_mesh_args))
-        self.plotter.update()
+        self.actors = tuple(self.plotter.add_mesh(mesh, render=False, **self.pyvista_mesh_args) for mesh in self.meshes)
+        self.request_update()
+
+    def mark_points_modified(self):
+        # the shared points array is changed in place, so vtk has to be told the points of every mesh changed
+        for vtk_points in self.vtk_points:
+            vtk_points.Modified()
 
     
 
+    def request_update(self):
+        # render right away, or once when the outermost batched_update() block exits
+        if self.update_suspended:
+            self.update_pending = True
+        else:
+            self.plotter.update()
+
+    @contextmanager
+    def batched_update(self):
+        # coalesce the plotter updates of several moves/rotations into a single render
+        self.update_suspended += 1
+        try:
+            yield
+        finally:
+            self.update_suspended -= 1
+            if not self.update_suspended:
+                self.finish_update()
+
+    def finish_update(self):
+        # called when the outermost batched_update() block exits, child classes can finish deferred work here
+        if self.update_pending:
+            self.update_pending = False
+            self.plotter.update()
+
     def set_location(self,origin,angles):
-        self._rotate(angles,increment = False)
-        self._move(origin,increment = False)
+        with self.batched_update():
+            self._rotate(angles,increment = False)
+            self._move(origin,increment = False)
                         
     def move(self, direction, multiplier):
+        if direction in DIRECTION_TABLE:
+            kind, unit_vector = DIRECTION_TABLE[direction]
+            if kind == 'move':
+                self._move(unit_vector * multiplier)
+            else:
+                self._rotate(unit_vector * multiplier)
+            return
         match direction:
-            case 'left':
-                position_shift = np.array([-1,0,0]) * multiplier
-                self._move(position_shift)
-            case 'right':
-                position_shift = np.array([1,0,0]) * multiplier
-                self._move(position_shift)
-            case 'dorsal':
-                position_shift = np.array([0,0,1]) * multiplier
-                self._move(position_shift)
-            case 'ventral':
-                position_shift = np.array([0,0,-1]) * multiplier
-                self._move(position_shift)
-            case 'anterior':    
-                position_shift = np.array([0,1,0]) * multiplier
-                self._move(position_shift)
-            case 'posterior':  
-                position_shift = np.array([0,-1,0]) * multiplier
-                self._move(position_shift)
-
-            case 'tilt up': 
-                angle_shift = np.array([1,0,0]) * multiplier
-                self._rotate(angle_shift)
-            case 'tilt down':
-                angle_shift = np.array([-1,0,0]) * multiplier
-                self._rotate(angle_shift)
-            case 'rotate left':
-                angle_shift = np.array([0,0,1]) * multiplier
-                self._rotate(angle_shift)
-            case 'rotate right': 
-                angle_shift = np.array([0,0,-1]) * multiplier
-                self._rotate(angle_shift)
-            case 'spin left':
-                angle_shift = np.array([0,1,0]) * multiplier
-                self._rotate(angle_shift)
-            case 'spin right':
-                angle_shift = np.array([0,-1,0]) * multiplier
-                self._rotate(angle_shift)
-            
             case 'retract':
                 position_shift = move3D(multiplier, *self.angles[[0,2]])
                 self._move(position_shift.astype(int))
@@ -115,8 +152,7 @@ class VVASPBaseVisualizerClass(ABC):
                 #self.__move(position_shift)
 
             case 'home':
-                self._move(np.array([0,0,0]),increment = False)
-                self._rotate(np.array([-90,0,0]),increment = False)
+                self.set_location(np.array([0,0,0]), np.array([-90,0,0]))
 
     def _move(self, position_shift, increment=True):     
         if increment:
@@ -126,10 +162,10 @@ class VVASPBaseVisualizerClass(ABC):
             old_position = np.array(self.origin)
             self.origin[:] = position_shift 
             position_shift = position_shift - old_position
-        # move the meshes
-        for i,mesh in enumerate(self.meshes):
-            mesh.shallow_copy(mesh.translate(position_shift))
-        self.plotter.update()
+        # move the meshes, the shared points array is shifted in place
+        self.mesh_points += position_shift
+        self.mark_points_modified()
+        self.request_update()
     
     def _rotate(self, angle_shift, increment=True):
         if increment:
@@ -141,16 +177,17 @@ class VVASPBaseVisualizerClass(ABC):
         # rotate the meshes
         old_rotation_matrix = self.rotation_matrix
         self.rotation_matrix = rotation_matrix_from_degrees(*self.angles)
-        for i,mesh in enumerate(self.meshes):
-            #rotations are performed in "probe space" so we need to shift the mesh to (0,0,0), rotate, then shift back
-            points = old_rotation_matrix.T @ (mesh.points - self.origin).T
-            mesh.points = (self.rotation_matrix @ points).T + self.origin
-            mesh.shallow_copy(mesh)
-        self.plotter.update()
+        # undo the old rotation and apply the new one in a single step, so the mesh points are only multiplied once
+        delta_rotation = self.rotation_matrix @ old_rotation_matrix.T
+        #rotations are performed in "probe space" (about the origin), fold the shift to (0,0,0) and back into one offset
+        offset = self.origin - delta_rotation @ self.origin
+        np.add(self.mesh_points @ delta_rotation.T, offset, out=self.mesh_points) # add the offset while writing back, only one temporary array
+        self.mark_points_modified()
+        self.request_update()
     
     def __del__(self):
         for actor in self.actors:
-            self.plotter.remove_actor(actor)
+            self.plotter.remove_actor(actor, render=False)
         self.plotter.update()
     
 class AbstractBaseProbe(VVASPBaseVisualizerClass):
@@ -170,25 +207,32 @@ class AbstractBaseProbe(VVASPBaseVisualizerClass):
         self.info = info # used to save the probe properties to a file
         self.entry_point = None
         self.root_intersection_mesh = root_intersection_mesh # a pyvista mesh to calculate the intersection point (usually the root of an atlas) 
+        self.root_intersection_bounds = root_intersection_mesh.bounds if root_intersection_mesh is not None else None # (xmin,xmax,ymin,ymax,zmin,zmax), to skip traces that can not hit the mesh
         if ray_trace_intersection and root_intersection_mesh is None:
             self.ray_trace_intersection = False #if no atlas mesh is passed, we cant ray trace the insertion
         else:
             self.ray_trace_intersection = ray_trace_intersection
         self.intersection_vector = None # an imaginary line from shank origin, used for calculating the intersection with brain surface
         self.intersection_point = None
+        self.cached_depth = None # cleared whenever the probe moves, see the depth property
+        self.entry_point_pending = False # the entry point is updated once the current batch of moves is done
+        self.ray_traced_location = None # the (origin, rotation_matrix) of the last ray trace, to skip tracing again from the same spot
 
         #the following mesh and actor are used to visualize the brain surface entry point
         #they are the result of a ray trace from the probe origin to the brain surface and obey unique logic
         #thus we will handle them separately from the other meshes
-        self.ball_mesh = pv.Sphere(center=np.array(starting_position).astype(np.float32), radius=SPHERE_RADIUS)
-        self.ball_actor = vistaplotter.add_mesh(self.ball_mesh, color='blue')
+        #the sphere is copied from a template around (0,0,0) and only translated afterwards, so it is never re-tessellated
+        self.ball_mesh = ENTRY_POINT_SPHERE.copy()
+        self.__place_ball_mesh(starting_position)
 
-        super().__init__(vistaplotter, starting_position, starting_angles, active)
+        with self.batched_update(): # render the new probe once, with its final colors
+            self.ball_actor = vistaplotter.add_mesh(self.ball_mesh, color='blue', render=False)
+            super().__init__(vistaplotter, starting_position, starting_angles, active)
 
-        if active:
-            self.make_active()
-        else:
-            self.make_inactive()
+            if active:
+                self.make_active()
+            else:
+                self.make_inactive()
 
     def drive_probe_from_entry(self, ml_ap_entry, angles, depth):
         # move the probe to a specific entry point and depth
@@ -197,68 +241,103 @@ class AbstractBaseProbe(VVASPBaseVisualizerClass):
         if self.root_intersection_mesh is None:
             raise ValueError("No atlas is defined, can not drive probe from atlas entry point")
 
-        # 1) place the probe 1000um above the entry point
-        above_entrypoint = np.concatenate([np.array(ml_ap_entry), np.array([1000])])
-        self.set_location(above_entrypoint, np.array(angles))
+        with self.batched_update(): # render once, after the probe reached its final position
+            # 1) place the probe 1000um above the entry point
+            above_entrypoint = np.concatenate([np.array(ml_ap_entry), np.array([1000])])
+            self.set_location(above_entrypoint, np.array(angles))
 
-        # 2) lower the probe to the entry point
-        # since we need to find the entry point and are above the target, ray trace straight down to find mesh surface
-        STRAIGHT_DOWN_VECTOR = np.array([0, 0, -10_000])
-        end = STRAIGHT_DOWN_VECTOR + self.origin
-        start = self.origin.astype(np.float32)
-        intersection_points = self.root_intersection_mesh.ray_trace(start, end)[0]
-        entry_point = intersection_points[np.argmax(intersection_points[:,2]),:].flatten()
-        self.set_location(entry_point, angles)
+            # 2) lower the probe to the entry point
+            # since we need to find the entry point and are above the target, ray trace straight down to find mesh surface
+            STRAIGHT_DOWN_VECTOR = np.array([0, 0, -10_000], dtype=np.float32)
+            intersection_points = self.root_intersection_mesh.ray_trace(self.origin, STRAIGHT_DOWN_VECTOR + self.origin)[0]
+            entry_point = intersection_points[np.argmax(intersection_points[:,2])]
+            self.set_location(entry_point, angles)
 
-        # 3) advance the probe to the desired depth
-        self.move('advance', depth)
+            # 3) advance the probe to the desired depth
+            self.move('advance', depth)
     
+    def __place_ball_mesh(self, center):
+        self.ball_mesh.points[:] = ENTRY_POINT_SPHERE.points + center
+
+    def __misses_root_bounds(self, start, end):
+        # slab test of the segment start->end against the bounding box of the root mesh,
+        # if the segment misses the box it can not hit the mesh and the ray trace can be skipped
+        tmin, tmax = 0., 1.
+        for axis in range(3):
+            lower, upper = self.root_intersection_bounds[2*axis], self.root_intersection_bounds[2*axis+1]
+            direction = end[axis] - start[axis]
+            if direction == 0:
+                if start[axis] < lower or start[axis] > upper:
+                    return True
+                continue
+            t0 = (lower - start[axis]) / direction
+            t1 = (upper - start[axis]) / direction
+            if t0 > t1:
+                t0, t1 = t1, t0
+            tmin = max(tmin, t0)
+            tmax = min(tmax, t1)
+            if tmin > tmax:
+                return True
+        return False
+
     def __ray_trace_intersection(self):
-        init_vector = (self.rotation_matrix @ INIT_VEC)
+        if self.ray_traced_location is not None:
+            traced_origin, traced_rotation = self.ray_traced_location
+            if np.array_equal(traced_origin, self.origin) and np.array_equal(traced_rotation, self.rotation_matrix):
+                return # nothing moved since the last trace, the entry point is still valid
+        self.ray_traced_location = (self.origin.copy(), self.rotation_matrix)
+        init_vector = self.rotation_matrix[:,1] * INIT_VEC[1] # INIT_VEC only points along y, so rotating it just scales the y column
         self.intersection_vector = init_vector + self.origin
-        start = self.origin.astype(np.float32)
-        end = self.intersection_vector.astype(np.float32)
-        points = self.root_intersection_mesh.ray_trace(start, end)[0]
+        if self.__misses_root_bounds(self.origin.tolist(), self.intersection_vector.tolist()):
+            self.entry_point = None
+            self.__place_ball_mesh(self.origin)
+            return
+        points = self.root_intersection_mesh.ray_trace(self.origin, self.intersection_vector)[0]
 
-        if points.shape[0] == 1:
-            self.entry_point = points[0,:].flatten()
-            self.ball_mesh.shallow_copy(pv.Sphere(center=points, radius=SPHERE_RADIUS))
-        elif points.shape[0] > 1: #pick the point with the highest z value if there are multiple
-            self.entry_point = points[np.argmax(points[:,2]),:].flatten()
-            self.ball_mesh.shallow_copy(pv.Sphere(center=self.entry_point, radius=SPHERE_RADIUS))
+        if points.shape[0] > 0: #pick the point with the highest z value if there are multiple
+            self.entry_point = points[np.argmax(points[:,2])] # a row of points is already 1-D, no need to flatten
+            self.__place_ball_mesh(self.entry_point)
         else:
             self.entry_point = None
-            self.ball_mesh.shallow_copy(pv.Sphere(center=self.origin, radius=SPHERE_RADIUS))
+            self.__place_ball_mesh(self.origin)
     
-    def _move(self, position_shift, increment=True):
-        super()._move(position_shift, increment)
-        if self.ray_trace_intersection:
+    def finish_update(self):
+        # ray trace once from the final pose of the batch, instead of after every single move/rotation
+        if self.entry_point_pending:
+            self.entry_point_pending = False
+            if self.ray_trace_intersection:
                 self.__ray_trace_intersection()
-        else:
-            self.ball_mesh.shallow_copy(pv.Sphere(center=self.origin, radius=SPHERE_RADIUS))
-        self.plotter.update()
+            else:
+                self.__place_ball_mesh(self.origin)
+            self.cached_depth = None # a depth read inside the batch was measured from the old entry point
+            self.update_pending = True
+        super().finish_update()
+
+    def _move(self, position_shift, increment=True):
+        with self.batched_update(): # one render and one ray trace for the meshes and the entry point
+            super()._move(position_shift, increment)
+            self.cached_depth = None
+            self.entry_point_pending = True
     
     def _rotate(self, angle_shift, increment=True):
-        super()._rotate(angle_shift, increment)
-        if self.ray_trace_intersection:
-                self.__ray_trace_intersection()
-        else:
-            self.ball_mesh.shallow_copy(pv.Sphere(center=self.origin, radius=SPHERE_RADIUS))
-        self.plotter.update()
+        with self.batched_update(): # one render and one ray trace for the meshes and the entry point
+            super()._rotate(angle_shift, increment)
+            self.cached_depth = None
+            self.entry_point_pending = True
 
     def make_active(self):
         self.active = True
         for actor in self.actors:
             #shnk.actor.prop.opacity = 1 #FIXME: opacity not working for some reason
             actor.prop.color = ACTIVE_COLOR
-        self.plotter.update()
+        self.request_update()
 
     def make_inactive(self):
         self.active = False
         for actor in self.actors:
             #shnk.actor.prop.opacity = .2
             actor.prop.color = INACTIVE_COLOR
-        self.plotter.update()
+        self.request_update()
     
     def xyz_locations(self, resolution=1):
         # returns a list of the brain regions that each shank (mesh) passes through
@@ -275,8 +354,10 @@ class AbstractBaseProbe(VVASPBaseVisualizerClass):
     def depth(self):
         if self.entry_point is None:
             return 0
-        else:
-            return np.linalg.norm(self.origin-self.entry_point)
+        if self.cached_depth is None:
+            dx, dy, dz = self.origin - self.entry_point # plain arithmetic is much cheaper than np.linalg.norm for a 3-vector
+            self.cached_depth = sqrt(dx*dx + dy*dy + dz*dz)
+        return self.cached_depth
             
     @property
     def probe_properties(self):
@@ -297,5 +378,5 @@ class AbstractBaseProbe(VVASPBaseVisualizerClass):
                                     DV=entry_point[2]),
                     depth_along_probe_axis=self.depth)
     def __del__(self):
-        self.plotter.remove_actor(self.ball_actor)
+        self.plotter.remove_actor(self.ball_actor, render=False)
         super().__del__()
\ No newline at end of file
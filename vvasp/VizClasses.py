@@ -1,5 +1,9 @@
 from .utils import *
-from .io import probe_geometries
+import pyvista as pv
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from .io import probe_geometries, load_mesh_file
+from .default_prefs import MESH_DIR
 from .BaseVizClasses import VVASPBaseVisualizerClass, AbstractBaseProbe, ACTIVE_COLOR, INACTIVE_COLOR
 
 class CustomMeshObject(VVASPBaseVisualizerClass):
@@ -31,15 +35,48 @@ class CustomMeshObject(VVASPBaseVisualizerClass):
         # Your mesh creation logic here
         # TODO: add a way to define transformations
         # TODO: define a new origin for the mesh 
-        for p in self.mesh_paths:
-            mesh = pv.read(p).scale(self.scale_factor)
-            mesh = mesh.translate(self.mesh_origin)
-            mesh = mesh.rotate_x(self.mesh_rotation[0])
-            mesh = mesh.rotate_y(self.mesh_rotation[1])
-            mesh = mesh.rotate_z(self.mesh_rotation[2])
-            #rotated_translation = rotation_matrix_from_degrees(*self.mesh_rotation).T @ self.mesh_origin # the translation of the mesh must be rotated into new axes
-            #mesh = mesh.translate(rotated_translation)
-            self.meshes.append(mesh)
+        if len(self.mesh_paths) > 1:
+            # the files are independent and vtk releases the GIL while parsing, so read them in parallel (map keeps the order)
+            with ThreadPoolExecutor(max_workers=min(8, len(self.mesh_paths))) as executor:
+                self.meshes = list(executor.map(self.load_mesh, self.mesh_paths))
+        else:
+            self.meshes = [self.load_mesh(p) for p in self.mesh_paths]
+
+    def load_mesh(self, path):
+        mesh = load_mesh_file(path)
+        # scale, translate and rotate in a single pass over the points
+        mesh.transform(mesh_transform_matrix(self.scale_factor, self.mesh_origin, self.mesh_rotation), inplace=True)
+        #rotated_translation = rotation_matrix_from_degrees(*self.mesh_rotation).T @ self.mesh_origin # the translation of the mesh must be rotated into new axes
+        #mesh = mesh.translate(rotated_translation)
+        return mesh
+
+@lru_cache(maxsize=None)
+def shank_rectangle_points(probetype):
+    # the shank corners only depend on the probe geometry, so they are built once per probetype
+    # and shared (read-only) by every probe of that type, shape (n_shanks, 4, 3)
+    geometry_data = probe_geometries[probetype]
+    n_shanks = min(len(geometry_data['shank_dims_um']), len(geometry_data['shank_offsets_um'])) # dims and offsets are paired up like zip()
+    dims = np.asarray(geometry_data['shank_dims_um'][:n_shanks], dtype=np.float32) # pyvista stores points as float32, so build them that way
+    offsets = np.asarray(geometry_data['shank_offsets_um'][:n_shanks], dtype=np.float32)
+    shank_points = np.zeros((n_shanks,4,3), dtype=np.float32) # the corners of each shank rectangle, these will be translated and rotated about the tip
+    shank_points[:,0,:2] = dims[:,:2]
+    shank_points[:,1,0] = dims[:,0]
+    shank_points[:,2,2] = dims[:,2]
+    shank_points[:,3] = shank_points[:,0] + shank_points[:,2] - shank_points[:,1] # the corner pv.Rectangle would add opposite the right angle
+    shank_points += offsets[:,None,:]
+    shank_points.flags.writeable = False
+    return shank_points
+
+@lru_cache(maxsize=None)
+def shank_mesh(probetype):
+    # template mesh with one quad per shank, all shanks of a probe share a single mesh (and actor) so they are drawn in one go.
+    # probes copy this instead of building it again, the copies have to be deep, shallow copies share the vtkPoints that pack_mesh_points() writes to
+    shank_points = shank_rectangle_points(probetype)
+    n_shanks = shank_points.shape[0]
+    faces = np.empty((n_shanks,5), dtype=np.int64) # [4, i0, i1, i2, i3] for every quad
+    faces[:,0] = 4
+    faces[:,1:] = np.arange(4*n_shanks).reshape(n_shanks,4)
+    return pv.PolyData(shank_points.reshape(-1,3).copy(), faces.ravel())
 
 class Probe(AbstractBaseProbe):
     name = "Probe"
@@ -60,15 +97,21 @@ class Probe(AbstractBaseProbe):
         super().__init__(vistaplotter, starting_position, starting_angles, active, ray_trace_intersection, root_intersection_mesh, **kwargs)
     
     def create_meshes(self):
-        for dims, offset in zip(self.shank_dims_um, self.shank_offsets_um):
-            shank_vectors = np.array([[dims[0],dims[1],0], #the orthogonal set of vectors used to define a rectangle, these will be translated and rotated about the tip
-                                      [dims[0],0,0],
-                                      [0,0,dims[2]]])
-            vecs = shank_vectors + np.array(offset).T
-            self.meshes.append(pv.Rectangle(vecs.astype(np.float32)))
+        self.meshes.append(shank_mesh(self.probetype).copy())
 
 class NeuropixelsChronicHolder(AbstractBaseProbe):
     name = "NP2 w/ chronic holder"
+    # scale (mm to um), offset and rotation of each holder mesh into probe space, composed into one affine at import
+    mesh_transforms = {'NP24': mesh_transform_matrix(1000, -np.array([-32.399,-12.612, 16.973]) * 1000, (0,0,90)),
+                       'NP1': mesh_transform_matrix(1000, -np.array([-.081, 1.978, -9.762]) * 1000, (-90,0,0)),
+                       'NP24a': mesh_transform_matrix(1000, -np.array([-33.259, 2.768, -2.080]) * 1000, (0,0,90)),}
+    # (chassis_type, probetype) -> (mesh file, display name) of each holder
+    mesh_mapping = {('head_fixed', 'NP24'): (MESH_DIR / 'np2_head_fixed.stl', 'NP2 chronic holder - head fixed'),
+                    ('freely_moving', 'NP24'): (MESH_DIR / 'np2_freely_moving.stl', 'NP2 chronic holder - freely moving'),
+                    ('head_fixed', 'NP24a'): (MESH_DIR / 'np2a_head_fixed.stl', 'NP2a chronic holder - head fixed'),
+                    ('freely_moving', 'NP24a'): (MESH_DIR / 'np2a_freely_moving.stl', 'NP2a chronic holder - freely moving'),
+                    ('head_fixed', 'NP1'): (MESH_DIR / 'np1_head_fixed.stl', 'NP1 chronic holder - head fixed'),
+                    ('freely_moving', 'NP1'): (MESH_DIR / 'np1_freely_moving.stl', 'NP1 chronic holder - freely moving'),}
     def __init__(self,
                  probetype,
                  chassis_type,
@@ -83,79 +126,45 @@ class NeuropixelsChronicHolder(AbstractBaseProbe):
         geometry_data = probe_geometries[probetype.replace('4a','4')]
         self.shank_offsets_um = geometry_data['shank_offsets_um'] # the offsets of the shanks in um
         self.shank_dims_um = geometry_data['shank_dims_um'] # the dimensions of one shank in um
-        self.active_colors = []
-        self.inactive_colors = []
-
-        from .default_prefs import MESH_DIR
-        if chassis_type == 'head_fixed' and probetype == 'NP24':
-            self.mesh_path = MESH_DIR / 'np2_head_fixed.stl'
-            self.name = 'NP2 chronic holder - head fixed'
-        elif chassis_type == 'freely_moving' and probetype == 'NP24':
-            self.mesh_path = MESH_DIR / 'np2_freely_moving.stl'
-            self.name = 'NP2 chronic holder - freely moving'
-        elif chassis_type == 'head_fixed' and probetype == 'NP24a':
-            self.mesh_path = MESH_DIR / 'np2a_head_fixed.stl'
-            self.name = 'NP2a chronic holder - head fixed'
-        elif chassis_type == 'freely_moving' and probetype == 'NP24a':
-            self.mesh_path = MESH_DIR / 'np2a_freely_moving.stl'
-            self.name = 'NP2a chronic holder - freely moving'
-        elif chassis_type == 'head_fixed' and probetype == 'NP1':
-            self.mesh_path = MESH_DIR / 'np1_head_fixed.stl'
-            self.name = 'NP1 chronic holder - head fixed'
-        elif chassis_type == 'freely_moving' and probetype == 'NP1':
-            self.mesh_path = MESH_DIR / 'np1_freely_moving.stl'
-            self.name = 'NP1 chronic holder - freely moving'
-        else:
+
+        if (chassis_type, probetype) not in self.mesh_mapping:
             raise ValueError(f"chassis_type \"{chassis_type}\" or probetype \"{probetype}\" not recognized.") 
+        self.mesh_path, self.name = self.mesh_mapping[(chassis_type, probetype)]
         super().__init__(vistaplotter, starting_position, starting_angles, active, ray_trace_intersection, root_intersection_mesh, **kwargs)
     
+    @classmethod
+    @lru_cache(maxsize=None)
+    def holder_mesh(cls, mesh_path, probetype):
+        # the holder mesh in probe space, loaded and transformed once per holder, instances copy it
+        mesh = load_mesh_file(mesh_path)
+        # scale, translate and rotate in a single pass over the points
+        mesh.transform(cls.mesh_transforms[probetype], inplace=True)
+        return mesh
+
     def create_meshes(self):
-        scale_factor = 1000
-        if self.probetype == 'NP24':
-            mesh_rotation = np.array([0,0,90])
-            mesh_origin = -np.array([-32.399,-12.612, 16.973]) * 1000
-        elif self.probetype == 'NP1':
-            mesh_rotation = np.array([-90,0,0])
-            mesh_origin = -np.array([-.081, 1.978, -9.762]) * 1000
-        elif self.probetype == 'NP24a':
-            mesh_rotation = np.array([0,0,90])
-            mesh_origin = -np.array([-33.259, 2.768, -2.080]) * 1000
-        else:
+        if self.probetype not in self.mesh_transforms:
             raise ValueError(f"probetype \"{self.probetype}\" not recognized.")
 
-        mesh = pv.read(self.mesh_path).scale(scale_factor)
-        mesh = mesh.translate(mesh_origin)
-        mesh = mesh.rotate_x(mesh_rotation[0])
-        mesh = mesh.rotate_y(mesh_rotation[1])
-        mesh = mesh.rotate_z(mesh_rotation[2])
-        #rotated_translation = rotation_matrix_from_degrees(*mesh_rotation).T @ mesh_origin # the translation of the mesh must be rotated into new axes
-        #mesh = mesh.translate(rotated_translation)
-        self.meshes.append(mesh)
-        self.active_colors.append('gray')
-        self.inactive_colors.append('gray')
-
-        for dims, offset in zip(self.shank_dims_um, self.shank_offsets_um):
-            shank_vectors = np.array([[dims[0],dims[1],0], #the orthogonal set of vectors used to define a rectangle, these will be translated and rotated about the tip
-                                      [dims[0],0,0],
-                                      [0,0,dims[2]]])
-            vecs = shank_vectors + np.array(offset).T
-            self.meshes.append(pv.Rectangle(vecs.astype(np.float32)))
-            self.active_colors.append(ACTIVE_COLOR)
-            self.inactive_colors.append(INACTIVE_COLOR)
+        self.meshes.append(self.holder_mesh(self.mesh_path, self.probetype).copy())
+        self.meshes.append(shank_mesh(self.probetype.replace('4a','4')).copy()) # the shanks are built like the ones of a bare probe
+
+        # (n_meshes, 3) rgb colors of the holder and the shanks, parsed once so switching the active object does not parse color names
+        self.active_colors = np.array([pv.Color(col).int_rgb for col in ['gray', ACTIVE_COLOR]], dtype=np.uint8)
+        self.inactive_colors = np.array([pv.Color(col).int_rgb for col in ['gray', INACTIVE_COLOR]], dtype=np.uint8)
     
     def make_active(self):
         self.active = True
         for col,actor in zip(self.active_colors,self.actors):
             #shnk.actor.prop.opacity = 1 #FIXME: opacity not working for some reason
             actor.prop.color = col
-        self.plotter.update()
+        self.request_update()
 
     def make_inactive(self):
         self.active = False
         for col,actor in zip(self.inactive_colors,self.actors):
             #shnk.actor.prop.opacity = .2
             actor.prop.color = col
-        self.plotter.update()
+        self.request_update()
 
 class CranialWindow5mm(VVASPBaseVisualizerClass):
     name = "Cranial Window - 5mm"
@@ -174,27 +183,10 @@ class Neuron(VVASPBaseVisualizerClass):
         pass
 
 
-#def get_classes():
-#    import inspect
-#    current_module = sys.modules[__name__]
-#    classes = {}
-#    for name, obj in inspect.getmembers(current_module):
-#        if inspect.isclass(obj) and inspect.getmodule(obj) == current_module:
-#            classes.update({obj.name: obj})
-#    classes.pop('Probe')
-#    for prbname in probe_geometries.keys():
-#        classes.update({prbname: Probe})
-#    return classes
-
 from functools import partial
-availible_viz_classes_for_gui = {'CustomMeshObject [NOT IMPLEMENTED]': CustomMeshObject, #objects availible to the PyQt GUI
-                                 'NP24': partial(Probe,'NP24'),
-                                 'NP1': partial(Probe,'NP1'),
-                                 'utah10x10': partial(Probe,'utah10x10'),
-                                 'NP2 chronic holder - head fixed': partial(NeuropixelsChronicHolder,'NP24','head_fixed'),
-                                 'NP2 chronic holder - freely moving': partial(NeuropixelsChronicHolder,'NP24','freely_moving'),
-                                 'NP2a chronic holder - head fixed': partial(NeuropixelsChronicHolder,'NP24a','head_fixed'),
-                                 'NP2a chronic holder - freely moving': partial(NeuropixelsChronicHolder,'NP24a','freely_moving'),
-                                 'NP1 chronic holder - head fixed': partial(NeuropixelsChronicHolder,'NP1','head_fixed'),
-                                 'NP1 chronic holder - freely moving': partial(NeuropixelsChronicHolder,'NP1','freely_moving'),
-                                 'Cranial Window - 5mm [NOT IMPLEMENTED]': CranialWindow5mm,}
\ No newline at end of file
+from types import MappingProxyType
+availible_viz_classes_for_gui = MappingProxyType({'CustomMeshObject [NOT IMPLEMENTED]': CustomMeshObject, #objects availible to the PyQt GUI, built once at import
+                                                  **{probetype: partial(Probe,probetype) for probetype in probe_geometries.keys()}, # every probe geometry gets an entry
+                                                  **{name: partial(NeuropixelsChronicHolder,probetype,chassis_type) # every holder gets an entry under its display name
+                                                     for (chassis_type, probetype), (mesh_path, name) in NeuropixelsChronicHolder.mesh_mapping.items()},
+                                                  'Cranial Window - 5mm [NOT IMPLEMENTED]': CranialWindow5mm,})
@@ -1,5 +1,9 @@
 from . import io
 from .utils import *
+import pyvista as pv
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from vtkmodules.vtkRenderingCore import vtkPolyDataMapper
 
 def list_availible_atlases():
     return [x.name for x in io.ATLAS_DIR.glob('*')]
@@ -32,10 +36,11 @@ class Atlas:
             structures = io.json.load(fd)
         with open(self.atlas_path/'metadata.json','r') as fd:
             metadata = io.json.load(fd)
-        maxdepth = np.max([len(p['structure_id_path']) for p in structures]) #get max tree depth
+        depths = np.fromiter(map(len, (s['structure_id_path'] for s in structures)), dtype=int, count=len(structures)) # tree depth of every structure
+        maxdepth = depths.max() #get max tree depth
         tmp_root = [s for s in structures if s['acronym'] == 'root'][0]
-        structures = [s for s in structures if len(s['structure_id_path']) <= max_tree_depth] #restrict to regions at or below max tree depth
-        structures = [s for s in structures if len(s['structure_id_path']) >= min_tree_depth] #restrict to regions at or below max tree depth
+        in_depth_range = (depths >= min_tree_depth) & (depths <= max_tree_depth) #restrict to regions between min and max tree depth
+        structures = [s for s, keep in zip(structures, in_depth_range) if keep]
         structures.append(tmp_root) #add root back in (it can get removed if min_tree_depth > 1)
         structures = pd.DataFrame(structures)
         self.structures = pd.DataFrame(structures)    
@@ -49,27 +54,66 @@ class Atlas:
         # load up meshes, rotate/translate them appropriately and compute the areas they occupy in space. 
         # Importantly, don't render them to the plotter yet, it will just bog it down.
         regions = list(self.structures.acronym.values)
-        axes = io.pv.Axes()
-        #axes.origin = self.bregma_location
-        axes.origin = np.array([0,0,0])
-        
         rotate5deg = True
+        # make bregma the origin and rotate the meshes so that [x,y,z] => [ML,AP,DV] (rotate about y by 90, then about x by -90),
+        # allenCCF also has a 5 degree tilt. all of it is composed into one affine so every mesh is only transformed once
+        to_bregma_space = mesh_transform_matrix(1, -self.bregma_location, (0,90,0))
+        to_bregma_space = mesh_transform_matrix(1, (0,0,0), (-90 + 5*rotate5deg,0,0)) @ to_bregma_space
+
+        # the transformed meshes are cached on disk as raw numpy arrays (.npz), later starts build the meshes straight from those
+        # instead of parsing the .obj files and transforming them again. the cache is keyed by the atlas, the transform itself and the stored dtype
+        points_dtype = np.dtype(np.float32) # the .obj files are read as float64, float32 is plenty for um coordinates and halves the memory
+        cache_key = hashlib.blake2b(str(self.atlas_path).encode(), digest_size=8)
+        cache_key.update(to_bregma_space.tobytes())
+        cache_key.update(points_dtype.str.encode())
+        cache_key = cache_key.hexdigest()
+        cache_dir = io.MESH_CACHE_DIR / f'{self.name}_{cache_key}'
+        # mesh file and color of every region, looked up once instead of filtering the structures table for each region
+        self.meshfiles = {acronym: self.atlas_path/'meshes'/f'{id}.obj' for acronym, id in zip(self.structures.acronym, self.structures.id)}
+        structure_colors = dict(zip(self.structures.acronym, self.structures.rgb_triplet))
 
-        for r in regions:
+        def load_region(r):
+            # returns (mesh, already_transformed)
             try:
-                s = io.load_structure_mesh(self.atlas_path, self.structures, r) 
+                cache_file = cache_dir / f'{self.meshfiles[r].stem}.npz'
+                if cache_file.exists() and cache_file.stat().st_mtime >= self.meshfiles[r].stat().st_mtime:
+                    try:
+                        with np.load(cache_file) as cached:
+                            mesh = pv.PolyData(cached['points'], cached['faces'])
+                            if 'normals' in cached:
+                                mesh.point_data.set_array(cached['normals'], 'Normals') # unlike item assignment this does not make them the active scalars
+                                mesh.point_data.active_normals_name = 'Normals' # the .obj reader sets them as the active normals, so the mapper uses them
+                        return mesh, True
+                    except Exception:
+                        pass # unreadable cache entry, parse the .obj again and overwrite it
+                return pv.read(self.meshfiles[r]), False # meshes are in um
             except:
+                return None, False
+        # reading the mesh files is most of the startup time, vtk releases the GIL while parsing so read them in parallel
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            loaded_regions = list(executor.map(load_region, regions))
+
+        for r, (mesh, already_transformed) in zip(regions, loaded_regions):
+            if mesh is None:
                 print(f'Failed to load mesh {r}')
                 self.structures = self.structures[self.structures.acronym != r]
                 continue
         
-            s[0].translate(-self.bregma_location, inplace=True) #make bregma the origin
-            s[0].rotate_y(90, point=axes.origin, inplace=True) # rotate the meshes so that [x,y,z] => [ML,AP,DV]
-            s[0].rotate_x(-90, point=axes.origin, inplace=True)
-            if rotate5deg:
-                s[0].rotate_x(5,point=axes.origin, inplace=True) # allenCCF has a 5 degree tilt
-            self.meshes[r] = s[0]
-            self.meshcols[r] = s[1]['rgb_triplet']
+            if not already_transformed:
+                mesh.transform(to_bregma_space, inplace=True)
+                mesh.points = mesh.points.astype(points_dtype)
+                try:
+                    cache_dir.mkdir(parents=True, exist_ok=True)
+                    cached = dict(points=mesh.points, faces=mesh.faces)
+                    if 'Normals' in mesh.point_data:
+                        cached['normals'] = mesh.point_data['Normals']
+                    tmp_file = cache_dir / f'{self.meshfiles[r].stem}.tmp.npz'
+                    np.savez(tmp_file, **cached)
+                    tmp_file.replace(cache_dir / f'{self.meshfiles[r].stem}.npz') # never leave a half written entry behind
+                except OSError:
+                    pass # the cache is only an optimization
+            self.meshes[r] = mesh
+            self.meshcols[r] = structure_colors[r]
         assert len(self.meshes) == len(self.structures)
 
         if show_root:
@@ -79,7 +123,7 @@ class Atlas:
                                   silhouette=False,
                                   name='root')
         if show_bregma:
-            self.bregma_actor = self.plotter.add_mesh(io.pv.Sphere(radius=100, center=(0,0,0)))
+            self.bregma_actor = self.plotter.add_mesh(pv.Sphere(radius=100, center=(0,0,0)))
 
     def add_atlas_region_mesh(self, region_acronym, side='both', force_replot=False, **pv_kwargs):
         if region_acronym in self.visible_region_actors.keys() and not force_replot:
@@ -93,12 +137,23 @@ class Atlas:
             pass
         else:
             raise ValueError(f'Invalid side {side}')
-        actor = self.plotter.add_mesh(m,
-                              color=self.meshcols[region_acronym],
-                              opacity = 0.7,
-                              render=False,
-                              silhouette=False,
-                              **pv_kwargs)
+        if pv_kwargs:
+            actor = self.plotter.add_mesh(m,
+                                  color=self.meshcols[region_acronym],
+                                  opacity = 0.7,
+                                  render=False,
+                                  silhouette=False,
+                                  **pv_kwargs)
+        else:
+            # regions are plain colored surfaces, build the mapper and actor directly. add_mesh spends most of its time
+            # setting up scalar and colormap handling that is never used here, which adds up when loading many regions
+            mapper = vtkPolyDataMapper()
+            mapper.SetInputData(m)
+            mapper.ScalarVisibilityOff()
+            actor = pv.Actor(mapper=mapper)
+            actor.prop.color = self.meshcols[region_acronym]
+            actor.prop.opacity = 0.7
+            self.plotter.add_actor(actor, reset_camera=False, render=False, pickable=True)
         self.visible_region_actors.update({region_acronym: actor})
     
     def remove_atlas_region_mesh(self, region_acronym):
@@ -3,7 +3,7 @@
 # I was thinking that the CLI can also just plot a figure from an saved file.
 # like load saved planning
 
-from .utils import *
+import sys # keep this module light, numpy/vtk/qt are only imported once the GUI starts
 
 def main():
     from argparse import ArgumentParser
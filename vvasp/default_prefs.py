@@ -9,6 +9,7 @@ EXPERIMENT_DIR = Path('~').expanduser() / 'vvasp' / 'experiments'
 MESH_DIR = Path(__file__).resolve().parents[1] / 'meshes'
 EXPORT_DIR = Path('~').expanduser() / 'vvasp' / 'exports'
 ATLAS_DIR = Path('~').expanduser()/'.brainglobe'
+MESH_CACHE_DIR = Path('~').expanduser() / 'vvasp' / 'mesh_cache' # atlas meshes already transformed into bregma space
 
 
 ALL_PREF_FILES = [PREFS_FILE, MOVEMENT_KEYBINDS_FILE, STATIC_KEYBINDS_FILE, PROBE_GEOMETRIES_FILE]
@@ -1,9 +1,11 @@
 from .utils import *
 import os
+from concurrent.futures import ThreadPoolExecutor
 from .default_prefs import (ALL_PREFS, 
                             DEFAULT_PROBE_GEOMETRIES,
                             EXPERIMENT_DIR,
                             MESH_DIR,
+                            MESH_CACHE_DIR,
                             EXPORT_DIR,
                             ALL_PREF_FILES, 
                             PREFS_FILE, 
@@ -69,6 +71,15 @@ def __load_prefs():
 
     return prefs, movement_keybinds, static_keybinds, probe_geometries
 
+def __probe_geometries_to_arrays(probe_geometries):
+    # convert the shank geometry of each probe to (n_shanks, 3) float32 arrays once at load time,
+    # so creating a probe does not have to convert the nested lists again.
+    # new dicts are built because some of the geometries are the DEFAULT_PROBE_GEOMETRIES dicts, which have to stay json serializable
+    return {name: {**geometry,
+                   'shank_offsets_um': np.asarray(geometry['shank_offsets_um'], dtype=np.float32),
+                   'shank_dims_um': np.asarray(geometry['shank_dims_um'], dtype=np.float32)}
+            for name, geometry in probe_geometries.items()}
+
 def list_experiments():
     raise NotImplementedError
     return experiments_list
@@ -94,6 +105,26 @@ def load_experiment_file(filepath):
         experiment_data = json.load(fd)
     return experiment_data
 
+@lru_cache(maxsize=64)
+def __read_mesh_file(resolved_path, mtime):
+    import pyvista as pv # vtk is only loaded once meshes are needed, reading preferences and probe geometries does not need it
+    return pv.read(resolved_path)
+
+def load_mesh_file(path):
+    # parse each mesh file only once (or again when it changes on disk), many objects can share the same file.
+    # every caller gets its own copy, so it can transform it freely
+    path = Path(path).resolve()
+    return __read_mesh_file(str(path), path.stat().st_mtime).copy(deep=True)
+
+def prefetch_mesh_files(paths):
+    # parse several mesh files in parallel (vtk releases the GIL while reading),
+    # the objects created afterwards then get them from the load_mesh_file cache
+    paths = {Path(p).resolve() for p in paths}
+    if len(paths) < 2:
+        return # nothing to overlap, load_mesh_file will read it when needed
+    with ThreadPoolExecutor(max_workers=min(4, len(paths))) as executor:
+        list(executor.map(lambda path: __read_mesh_file(str(path), path.stat().st_mtime), paths))
+
 def load_structure_mesh(atlaspath,structures,acronym):
     # meshes are in um
     id = structures[structures.acronym == acronym].id.values
@@ -102,6 +133,7 @@ def load_structure_mesh(atlaspath,structures,acronym):
     else:
         return
     mesh = atlaspath/'meshes'/f'{id}.obj'
+    import pyvista as pv
     mesh = pv.read(mesh)
     return mesh, structures[structures.acronym == acronym].iloc[0]
 
@@ -109,4 +141,5 @@ def load_structure_mesh(atlaspath,structures,acronym):
 if not PREFS_FILE.exists():
     __setup_prefs()
 
-preferences, movement_keybinds, static_keybinds, probe_geometries = __load_prefs()
\ No newline at end of file
+preferences, movement_keybinds, static_keybinds, probe_geometries = __load_prefs()
+probe_geometries = __probe_geometries_to_arrays(probe_geometries)
\ No newline at end of file
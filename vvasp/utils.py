@@ -1,34 +1,45 @@
 import numpy as np
 import subprocess
-from functools import partial
+from functools import partial, lru_cache
 import pandas as pd
-import pyvista as pv
 import sys
 import os
 from pathlib import Path
 import json
 
-from math import cos, sin, radians
+from math import cos, sin, sqrt, radians
 
+@lru_cache(maxsize=1024) # the same whole-degree angles come up over and over while steering a probe
 def rotation_matrix_from_degrees(x_rot, y_rot, z_rot):
     """Return a rotation matrix to rotate a vector in 3D space. Pass the angles in degrees, not radians.
+    The returned matrix is cached and shared between callers, so it is read-only.
     Max Melin, 2024"""
     alpha = radians(z_rot)
     beta = radians(y_rot)
     gamma = radians(x_rot)
+    ca, sa = cos(alpha), sin(alpha)
+    cb, sb = cos(beta), sin(beta)
+    cg, sg = cos(gamma), sin(gamma)
 
-    Rz = np.array([[cos(alpha), -sin(alpha), 0],
-                     [sin(alpha), cos(alpha), 0],
-                     [0, 0, 1]])
-    Ry = np.array([[cos(beta), 0, sin(beta)],
-                   [0, 1, 0],
-                   [-sin(beta), 0, cos(beta)]])
-    Rx = np.array([[1,0,0],
-                   [0, cos(gamma), -sin(gamma)],
-                   [0, sin(gamma), cos(gamma)]])
-
-    #return Rz @ Ry @ Rx
-    return Rz @ Rx @ Ry # this is the correct order of rotations for the probe
+    # Rz @ Rx @ Ry written out in closed form, this is the correct order of rotations for the probe
+    R = np.array([[ca*cb - sa*sg*sb, -sa*cg, ca*sb + sa*sg*cb],
+                  [sa*cb + ca*sg*sb,  ca*cg, sa*sb - ca*sg*cb],
+                  [          -cg*sb,     sg,            cg*cb]], dtype=np.float32) # float32 like the vtk points
+    R.flags.writeable = False
+    return R
+
+def mesh_transform_matrix(scale_factor, translation, rotation_degrees):
+    """Return the 4x4 affine that scales a mesh, translates it and then rotates it about x, y and z (in that order).
+    Same result as chaining pyvista's scale, translate, rotate_x, rotate_y and rotate_z, but the points are only transformed once."""
+    rx, ry, rz = (radians(a) for a in rotation_degrees)
+    Rx = np.array([[1, 0, 0], [0, cos(rx), -sin(rx)], [0, sin(rx), cos(rx)]])
+    Ry = np.array([[cos(ry), 0, sin(ry)], [0, 1, 0], [-sin(ry), 0, cos(ry)]])
+    Rz = np.array([[cos(rz), -sin(rz), 0], [sin(rz), cos(rz), 0], [0, 0, 1]])
+    R = Rz @ Ry @ Rx
+    M = np.eye(4)
+    M[:3,:3] = R * scale_factor
+    M[:3,3] = R @ np.asarray(translation, dtype=float)
+    return M
 
 def move3D(distance, phi, theta):
     """Move a point in 3D space by a distance and angles. 
@@ -61,6 +61,13 @@ class VVASP(QMainWindow):
         self.active_object = None
         self.visible_regions = []
         self.shortcuts_connected = False
+        # key repeats can arrive faster than a probe is moved, ray traced and rendered,
+        # so movements are collected and applied together on the next tick of this timer
+        self.pending_movements = []
+        self.movement_timer = QTimer(self)
+        self.movement_timer.setSingleShot(True)
+        self.movement_timer.setInterval(16)
+        self.movement_timer.timeout.connect(self._apply_pending_movements)
 
         self.vlayout = QVBoxLayout()
         # TODO: Make this work with QDockWidget.
@@ -230,12 +237,25 @@ class VVASP(QMainWindow):
         if disconnect_existing: #handle case where no probe is active yet
             self._disconnect_shortcuts()
         for shortcut, (direction,multiplier) in self.dynamic_shortcuts.items():
-            def _shortcut_handler_function(d=direction, m=multiplier):
-                self.objects[self.active_object].move(d, m) # connect the function to move the probe
-                self._update_probe_position_text() # update the text box with the new position
-            func = lambda d=direction,m=multiplier:_shortcut_handler_function(d,m)
+            func = lambda d=direction,m=multiplier:self._queue_movement(d,m) # connect the function to move the probe
             shortcut.activated.connect(func)
         self.shortcuts_connected = True
+
+    def _queue_movement(self, direction, multiplier):
+        self.pending_movements.append((direction, multiplier))
+        if not self.movement_timer.isActive():
+            self.movement_timer.start()
+
+    def _apply_pending_movements(self):
+        self.movement_timer.stop()
+        movements, self.pending_movements = self.pending_movements, []
+        if self.active_object is None or len(movements) == 0:
+            return
+        prb = self.objects[self.active_object]
+        with prb.batched_update(): # a single ray trace and render for all queued movements
+            for direction, multiplier in movements:
+                prb.move(direction, multiplier)
+        self._update_probe_position_text() # update the text box with the new position
             
     def _init_atlas_view_box(self):
         self.atlas_view_box = QGroupBox(f'Atlas View: {io.preferences["atlas"]}')
@@ -293,10 +313,13 @@ class VVASP(QMainWindow):
         if len(self.objects) > 0:
             self._disconnect_shortcuts()
         self.objects = []
-        for i,p in enumerate(experiment_data['probes']):
+        self.pending_movements = [] # drop movements queued for the old objects
+        classes = [VizClasses.availible_viz_classes_for_gui[p['probetype']] for p in experiment_data['probes']]
+        io.prefetch_mesh_files([VizClasses.NeuropixelsChronicHolder.mesh_mapping[(cls.args[1], cls.args[0])][0] # read the holder meshes of all probes at once
+                                for cls in classes if isinstance(cls, partial) and cls.func is VizClasses.NeuropixelsChronicHolder])
+        for i,(p,cls) in enumerate(zip(experiment_data['probes'], classes)):
             angles = [p['angles']['elevation'], p['angles']['spin'], p['angles']['azimuth']]
             origin = [p['tip']['ML'], p['tip']['AP'], p['tip']['DV']]
-            cls = VizClasses.availible_viz_classes_for_gui[p['probetype']]
             self.objects.append(cls(self.plotter,
                                origin,
                                angles,
@@ -316,6 +339,7 @@ class VVASP(QMainWindow):
         if len(self.objects) > 0:
             self._disconnect_shortcuts()
         self.objects = []
+        self.pending_movements = [] # drop movements queued for the old objects
         self.atlas = atlas_utils.Atlas(self.plotter, min_tree_depth=8, max_tree_depth=8) #TODO: allow the user to update tree depth
         self.active_object = None
         self.filename = None
@@ -373,6 +397,7 @@ class VVASP(QMainWindow):
             self.update_active_object((self.active_object - 1) % len(self.objects))
     
     def delete_object(self): # Todo: verify this works
+        self._apply_pending_movements()
         if len(self.objects) > 0:
             self.objects.pop(self.active_object)
             if len(self.objects) > 0:
@@ -383,6 +408,7 @@ class VVASP(QMainWindow):
                 self._disconnect_shortcuts()
     
     def update_active_object(self, active_object):
+        self._apply_pending_movements() # queued movements belong to the previously active object
         self.active_object = active_object
         for (i,prb) in enumerate(self.objects):
             if self.active_object == i: